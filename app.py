@@ -1,31 +1,162 @@
 import streamlit as st
 import pandas as pd
+import polars as pl
 import plotly.express as px
 import os
+import csv
+import time
+import tempfile
+import threading
 from io import BytesIO
 
 # --- 1. Setup & Functions ---
-FILE_NAME = "expenses.csv"
+FILE_NAME = "expenses.parquet"  # Compacted, typed store
+LOG_FILE = "expenses.csv"       # Append-only log of rows not yet compacted
+COLUMNS = ["Date", "Category", "Amount", "Description"]
+COMPACT_BYTES = 64 * 1024       # Fold the log into Parquet once it grows past this
+FLUSH_ROWS = 16                 # Buffered rows written to the log in one go
+FLUSH_SECONDS = 30              # ...or once the oldest buffered row is this old
+FLUSH_CHECK_SECONDS = 5         # How often the buffer's age is checked
+# Worst case a buffered row waits for: it can turn FLUSH_SECONDS old just after a check
+MAX_UNSAVED_SECONDS = FLUSH_SECONDS + FLUSH_CHECK_SECONDS
 
-def load_data():
-    """Loads the CSV file and ensures the Date column is actually dates."""
+def file_stat(path):
+    """Returns a file's (mtime, size), or (0, 0) if missing."""
+    if os.path.exists(path):
+        stat = os.stat(path)
+        return (stat.st_mtime, stat.st_size)
+    return (0, 0)
+
+def data_version():
+    """Cheap cache key for the data files: changes whenever either one is written."""
+    return (file_stat(FILE_NAME), file_stat(LOG_FILE))
+
+@st.cache_data(ttl=None)
+def load_data(version):
+    """Loads the Parquet store plus any appended CSV rows, newest first.
+
+    Parquet keeps the Date column as datetime64, so only the small log needs date parsing.
+    Cached on the files' (mtime, size) so reruns don't re-read (or re-sort) unchanged data.
+    """
+    frames = []
     if os.path.exists(FILE_NAME):
-        df = pd.read_csv(FILE_NAME)
-        # FIX: Convert the 'Date' column to datetime objects
-        df["Date"] = pd.to_datetime(df["Date"])
-        return df
+        frames.append(pd.read_parquet(FILE_NAME))
+    if os.path.exists(LOG_FILE):
+        # Arrow's multithreaded reader parses the ISO dates during the read itself
+        frames.append(pd.read_csv(LOG_FILE, engine="pyarrow", parse_dates=["Date"]))
+    if frames:
+        df = pd.concat(frames, ignore_index=True)
+        # Files hold rows oldest-first; a stable ascending sort reversed puts the most
+        # recently added row first among same-day rows, matching insert_sorted
+        return df.sort_values("Date", kind="stable").iloc[::-1].reset_index(drop=True)
     else:
-        return pd.DataFrame(columns=["Date", "Category", "Amount", "Description"])
+        return pd.DataFrame(columns=COLUMNS)
+
+@st.cache_resource
+def data_lock():
+    """Process-wide lock shared by all sessions, held while the data files are written."""
+    return threading.Lock()
+
+def append_log(rows):
+    """Appends rows to the CSV log, writing the header if the file is new. Caller holds data_lock()."""
+    write_header = not os.path.exists(LOG_FILE)
+    with open(LOG_FILE, "a", newline="") as f:
+        writer = csv.writer(f)
+        if write_header:
+            writer.writerow(COLUMNS)
+        writer.writerows(rows)
+
+def save_data(rows):
+    """Appends expense rows to the CSV log."""
+    with data_lock():
+        append_log(rows)
+    # Drop the cached copy so the next rerun picks up the new rows
+    load_data.clear()
+
+def flush_pending():
+    """Writes all buffered rows to the CSV log with a single open/close."""
+    pending = st.session_state.pending_rows
+    if pending:
+        save_data(pending)
+        pending.clear()
+
+def insert_sorted(df, row):
+    """Inserts a row into the newest-first dataframe at its date position.
+
+    Ties go before existing rows of the same date, the same order load_data produces.
+    """
+    new_row = pd.DataFrame([row], columns=COLUMNS)
+    new_row["Date"] = pd.to_datetime(new_row["Date"])
+    if df.empty:
+        return new_row
+    # searchsorted needs ascending order, so search the reversed dates
+    ascending = df["Date"].to_numpy()[::-1]
+    pos = len(df) - ascending.searchsorted(new_row["Date"].to_numpy()[0], side="right")
+    return pd.concat([df.iloc[:pos], new_row, df.iloc[pos:]], ignore_index=True)
+
+def compact_data():
+    """Folds the CSV log into the Parquet store.
 
-def save_data(df):
-    """Saves the updated dataframe to CSV."""
-    df.to_csv(FILE_NAME, index=False)
+    The log is first claimed by renaming it to a private staging file, so rows other
+    sessions flush meanwhile land in a fresh log instead of being deleted with it. The
+    new Parquet file is built from what is on disk (not a preloaded frame), written to a
+    temp file and swapped in atomically, so a crash mid-write never corrupts the store.
+    """
+    lock = data_lock()
+    if not lock.acquire(blocking=False):
+        return  # Another session is already compacting
+    try:
+        data_dir = os.path.dirname(os.path.abspath(FILE_NAME))
+        fd, staging_path = tempfile.mkstemp(dir=data_dir, suffix=".compacting")
+        os.close(fd)
+        try:
+            os.replace(LOG_FILE, staging_path)
+        except FileNotFoundError:
+            os.remove(staging_path)
+            return  # Log already compacted
+        fd, tmp_path = tempfile.mkstemp(dir=data_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            # Stored oldest-first (insertion order) so load_data's stable sort keeps ties stable
+            frames = [pd.read_csv(staging_path, engine="pyarrow", parse_dates=["Date"])]
+            if os.path.exists(FILE_NAME):
+                frames.insert(0, pd.read_parquet(FILE_NAME))
+            pd.concat(frames, ignore_index=True).to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, FILE_NAME)
+        except BaseException:
+            os.remove(tmp_path)
+            # Put the claimed rows back in front of anything logged since
+            with open(staging_path, newline="") as f:
+                claimed = list(csv.reader(f))[1:]
+            if os.path.exists(LOG_FILE):
+                with open(LOG_FILE, newline="") as f:
+                    claimed += list(csv.reader(f))[1:]
+                os.remove(LOG_FILE)
+            append_log(claimed)
+            os.remove(staging_path)
+            raise
+        os.remove(staging_path)
+    finally:
+        lock.release()
+        load_data.clear()
 
-def convert_df_to_excel(df):
-    """Converts the dataframe to an Excel file in memory."""
+@st.cache_data(max_entries=4)
+def pie_fig(cat_totals):
+    """Builds the category pie chart; cached on the (Category, Amount) tuples."""
+    totals = pd.DataFrame(cat_totals, columns=['Category', 'Amount'])
+    return px.pie(totals, values='Amount', names='Category',
+                  title='Where is your money going?', hole=0.3)
+
+@st.cache_data(max_entries=2)
+def convert_df_to_excel(version, _df):
+    """Converts the dataframe to an Excel file in memory.
+
+    Goes through polars' Arrow-backed writer rather than pandas' ExcelWriter;
+    cached on version (file stats + unsaved rows) so Streamlit never has to hash
+    the dataframe itself.
+    """
     output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Expenses')
+    pl.from_pandas(_df).write_excel(workbook=output, worksheet='Expenses')
     processed_data = output.getvalue()
     return processed_data
 
@@ -34,7 +165,33 @@ st.set_page_config(page_title="My Monthly Expense Tracker", layout="centered")
 st.title("💰 Monthly Expense Tracker")
 
 # Load existing data
-df = load_data()
+version = data_version()
+df = load_data(version)
+if os.path.exists(LOG_FILE) and os.path.getsize(LOG_FILE) > COMPACT_BYTES:
+    compact_data()
+    version = data_version()
+    df = load_data(version)
+
+# Rows added this session but not yet written to disk
+if "pending_rows" not in st.session_state:
+    st.session_state.pending_rows = []
+
+# Running per-category totals, updated on insert instead of a groupby every rerun.
+# Rebuilt whenever the files change (e.g. another session saved rows).
+if st.session_state.get("cat_totals_version") != version:
+    cat_totals = df.groupby("Category")["Amount"].sum().to_dict()
+    for _, row_category, row_amount, _ in st.session_state.pending_rows:
+        cat_totals[row_category] = cat_totals.get(row_category, 0) + row_amount
+    st.session_state.cat_totals = cat_totals
+    st.session_state.cat_totals_version = version
+# Loaded frame with the pending rows merged in, rebuilt only when either side changes
+view_key = (version, len(st.session_state.pending_rows))
+if st.session_state.get("view_key") != view_key:
+    for row in st.session_state.pending_rows:
+        df = insert_sorted(df, row)
+    st.session_state.view_df = df
+    st.session_state.view_key = view_key
+df = st.session_state.view_df
 
 # --- 3. Input Form (Sidebar) ---
 st.sidebar.header("Add New Expense")
@@ -47,40 +204,69 @@ with st.sidebar.form("expense_form", clear_on_submit=True):
     submitted = st.form_submit_button("Add Expense")
 
     if submitted:
-        new_data = pd.DataFrame({
-            "Date": [pd.to_datetime(date)],  # Ensure new data is also datetime
-            "Category": [category],
-            "Amount": [amount],
-            "Description": [description]
-        })
-        # Combine old data with new data
-        df = pd.concat([df, new_data], ignore_index=True)
-        save_data(df)
-        st.sidebar.success("Expense added!")
+        # Buffer the row; the log is only appended to once enough rows pile up
+        row = [date.isoformat(), category, amount, description]
+        if not st.session_state.pending_rows:
+            st.session_state.pending_since = time.time()
+        st.session_state.pending_rows.append(row)
+        if len(st.session_state.pending_rows) >= FLUSH_ROWS:
+            # Once every FLUSH_ROWS inserts: reload so the view and cache keys match the files
+            flush_pending()
+            version = data_version()
+            df = load_data(version)
+            st.session_state.cat_totals = df.groupby("Category")["Amount"].sum().to_dict()
+            st.session_state.cat_totals_version = version
+        else:
+            df = insert_sorted(df, row)
+            cat_totals = st.session_state.cat_totals
+            cat_totals[category] = cat_totals.get(category, 0) + amount
+        st.session_state.view_df = df
+        st.session_state.view_key = (version, len(st.session_state.pending_rows))
+        if st.session_state.pending_rows:
+            st.sidebar.success(f"Expense added! It will be saved to disk within {MAX_UNSAVED_SECONDS} s.")
+        else:
+            st.sidebar.success("Expense added and saved!")
+
+# Ticks on its own so buffered rows get written even while the user is idle. The
+# timer is not reset by full reruns, hence the short check interval plus age test.
+@st.fragment(run_every=FLUSH_CHECK_SECONDS)
+def pending_status():
+    pending = st.session_state.pending_rows
+    if pending and time.time() - st.session_state.pending_since >= FLUSH_SECONDS:
+        flush_pending()
+    if pending:
+        # Reserve the caption's slot, but only fill it once the button click is handled
+        caption = st.empty()
+        if st.button("💾 Save now"):
+            flush_pending()
+            st.success("Expenses saved!")
+        else:
+            caption.caption(f"{len(pending)} expense(s) not saved yet")
+
+with st.sidebar:
+    pending_status()
 
 # --- 4. Dashboard (Main Panel) ---
 if not df.empty:
     # Basic Stats
-    total_spent = df["Amount"].sum()
+    total_spent = sum(st.session_state.cat_totals.values())
     st.metric("Total Spent", f"${total_spent:,.2f}")
 
     # --- PIE CHART FEATURE ---
     st.subheader("Expenses by Category")
-    # Group data by category to sum amounts
-    category_totals = df.groupby("Category")["Amount"].sum().reset_index()
-    
-    # Create the chart
-    fig = px.pie(category_totals, values='Amount', names='Category', 
-                 title='Where is your money going?', hole=0.3)
+    # Create the chart (reused across reruns until the totals change)
+    fig = pie_fig(tuple(st.session_state.cat_totals.items()))
     st.plotly_chart(fig, use_container_width=True)
 
-    # Show Dataframe sorted by Date
+    # Show Dataframe sorted by Date (already kept newest first)
     st.subheader("Recent Expenses")
-    st.dataframe(df.sort_values(by="Date", ascending=False), use_container_width=True)
+    st.dataframe(df, use_container_width=True)
 
     # --- EXCEL DOWNLOAD FEATURE ---
     st.subheader("Download Data")
-    excel_data = convert_df_to_excel(df)
+    # cache_data is shared by all sessions, so the key carries this session's unsaved rows
+    pending_key = tuple(map(tuple, st.session_state.pending_rows))
+    excel_data = convert_df_to_excel((version, pending_key), df)
     st.download_button(
         label="📥 Download as Excel",
         data=excel_data,
@@ -90,11 +276,3 @@ if not df.empty:
 
 else:
     st.info("No expenses added yet. Use the sidebar to add your first expense!")
-def load_data():
-    if os.path.exists(FILE_NAME):
-        df = pd.read_csv(FILE_NAME)
-        # ⬇️ THIS LINE IS REQUIRED TO FIX THE SORTING ERROR
-        df["Date"] = pd.to_datetime(df["Date"]) 
-        return df
-    else:
-        return pd.DataFrame(columns=["Date", "Category", "Amount", "Description"])
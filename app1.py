@@ -1,6 +1,8 @@
 import streamlit as st
 import yfinance as yf
 import pandas as pd
+import numpy as np
+from numba import njit
 import plotly.graph_objects as go
 import pytz
 from datetime import datetime, time
@@ -11,6 +13,7 @@ INITIAL_CAPITAL = 1000000  # 10 Lakhs
 MAX_ALLOCATION_PER_TRADE = 0.20  # Max 20% of capital per stock for diversification
 TARGET_PROFIT = 0.02  # Sell at 2% profit
 STOP_LOSS = 0.01      # Sell at 1% loss
+MOMENTUM_THRESHOLD = 0.005  # Buy when price is up > 0.5% from candle open
 MARKET_OPEN = time(9, 15)
 MARKET_CLOSE = time(15, 30)
 TIMEZONE = pytz.timezone('Asia/Kolkata')
@@ -18,6 +21,11 @@ TIMEZONE = pytz.timezone('Asia/Kolkata')
 # Watchlist (Top Liquid Stocks in NSE for Momentum)
 WATCHLIST = ['RELIANCE.NS', 'TCS.NS', 'INFY.NS', 'HDFCBANK.NS', 'ICICIBANK.NS', 
              'SBIN.NS', 'BHARTIARTL.NS', 'ITC.NS', 'KOTAKBANK.NS', 'LT.NS']
+NIFTY_TICKER = '^NSEI'
+CACHE_SECONDS = 30  # How long a market data snapshot is reused across reruns
+TICK_SECONDS = 5    # Bot cycle interval while running
+HOLDINGS_COLUMNS = ["Ticker", "Qty", "Buy Price"]
+TRADE_LOG_COLUMNS = ["Action", "Ticker", "Price", "Qty", "PnL", "Time"]
 
 # --- Helper Functions ---
 
@@ -27,101 +35,141 @@ def is_market_open():
     # For educational testing, you might want to comment out the next line to test offline
     return MARKET_OPEN <= now <= MARKET_CLOSE
 
+@st.cache_data(ttl=CACHE_SECONDS)
+def download_data(tickers, time_bucket):
+    """Cached yf.download; time_bucket changes every CACHE_SECONDS to force a refresh."""
+    return yf.download(tickers, period="1d", interval="5m", group_by='ticker', progress=False)
+
 def get_live_data(tickers):
-    """Fetches live data for watchlist."""
+    """Fetches live data for all tickers (watchlist + Nifty) in a single request."""
     try:
-        data = yf.download(tickers, period="1d", interval="5m", group_by='ticker', progress=False)
+        data = download_data(tickers, int(t_lib.time() // CACHE_SECONDS))
         return data
     except Exception as e:
         st.error(f"Error fetching data: {e}")
         return None
 
+def latest_quotes(data):
+    """Returns the last candle as a ticker x field frame (Open, High, Low, Close, ...)."""
+    return data.iloc[-1].unstack(level=1)
+
+def current_prices(data, portfolio):
+    """Latest close for every held position, falling back to its buy price when unquoted."""
+    if data is None or data.empty:
+        return portfolio['buy_price']
+    prices = latest_quotes(data)['Close'].reindex(portfolio['tickers']).to_numpy(np.float64)
+    return np.where(np.isnan(prices), portfolio['buy_price'], prices)
+
+@njit(cache=True)
+def momentum_scores(opens, closes, thresh):
+    """Returns (index, pct_change) for every candle whose gain beats thresh.
+
+    Candles with a non-positive open are bad quotes and are skipped; dividing by them
+    would raise ZeroDivisionError under Numba's python error model.
+    """
+    out_idx = np.empty(len(opens), np.int64)
+    out_pct = np.empty(len(opens), np.float64)
+    n = 0
+    for i in range(len(opens)):
+        if opens[i] <= 0:
+            continue
+        p = (closes[i] - opens[i]) / opens[i]
+        if p > thresh:
+            out_idx[n] = i
+            out_pct[n] = p
+            n += 1
+    return out_idx[:n], out_pct[:n]
+
 def analyze_market(data):
     """
     Momentum Strategy: Picks stocks with > 0.5% gain and positive trend.
-    Returns a DataFrame of 'Buy' signals.
+    Returns a list of 'Buy' signals, strongest first.
     """
-    signals = []
     if data is None or data.empty:
         return []
 
-    for ticker in WATCHLIST:
-        try:
-            # Handle Multi-index columns from yfinance
-            stock_data = data[ticker]
-            if stock_data.empty:
-                continue
-            
-            latest = stock_data.iloc[-1]
-            open_price = latest['Open']
-            close_price = latest['Close']
-            
-            # Simple Momentum Condition: Price is up > 0.5% from candle open
-            pct_change = (close_price - open_price) / open_price
-            
-            if pct_change > 0.005: # 0.5% momentum threshold
-                signals.append({
-                    'ticker': ticker,
-                    'price': close_price,
-                    'change': pct_change
-                })
-        except KeyError:
-            continue
-            
-    return sorted(signals, key=lambda x: x['change'], reverse=True) # Maximize potential
+    # One compiled pass over the last candle of every watchlist ticker
+    latest = latest_quotes(data).reindex(WATCHLIST).dropna(subset=['Open', 'Close'])
+    closes = latest['Close'].to_numpy(np.float64)
+
+    # Simple Momentum Condition: Price is up > 0.5% from candle open
+    idx, pct = momentum_scores(latest['Open'].to_numpy(np.float64), closes, MOMENTUM_THRESHOLD)
+    order = np.argsort(-pct) # Maximize potential
+
+    return [{'ticker': latest.index[idx[j]], 'price': closes[idx[j]], 'change': pct[j]}
+            for j in order]
+
+@st.cache_data(max_entries=4)
+def nifty_fig(last_candle, _nifty):
+    """Builds the Nifty candlestick chart; only rebuilt when the last candle changes.
+
+    last_candle is (timestamp, OHLC...) of the final row, so the still-forming
+    candle is redrawn whenever its prices move, not just when a new one starts.
+    """
+    fig = go.Figure(data=[go.Candlestick(x=_nifty.index,
+                    open=_nifty['Open'], high=_nifty['High'],
+                    low=_nifty['Low'], close=_nifty['Close'])])
+    fig.update_layout(height=300, margin=dict(l=0, r=0, t=0, b=0))
+    return fig
 
 # --- Session State Management (Virtual Account) ---
 
 if 'balance' not in st.session_state:
     st.session_state.balance = INITIAL_CAPITAL
 if 'portfolio' not in st.session_state:
-    st.session_state.portfolio = {} # Format: {'TICKER': {'qty': 10, 'buy_price': 100}}
-if 'trade_log' not in st.session_state:
-    st.session_state.trade_log = []
+    # Struct-of-arrays: position i is (tickers[i], qty[i], buy_price[i])
+    st.session_state.portfolio = {'tickers': [],
+                                  'qty': np.zeros(0, dtype=np.int64),
+                                  'buy_price': np.zeros(0, dtype=np.float64)}
+if 'holdings_df' not in st.session_state:
+    # Display copy of the portfolio, updated on buy/sell instead of rebuilt every rerun
+    st.session_state.holdings_df = pd.DataFrame(columns=HOLDINGS_COLUMNS)
+if 'trade_log_df' not in st.session_state:
+    st.session_state.trade_log_df = pd.DataFrame(columns=TRADE_LOG_COLUMNS)
 if 'bot_active' not in st.session_state:
     st.session_state.bot_active = False
 
+def log_trade(action, ticker, price, qty, pnl):
+    """Appends one row to the trade log DataFrame in place."""
+    log = st.session_state.trade_log_df
+    log.loc[len(log)] = [action, ticker, round(price, 2), qty, pnl,
+                         datetime.now(TIMEZONE).strftime("%H:%M:%S")]
+
 # --- Trading Bot Logic ---
 
-def execute_trade_cycle():
+def execute_trade_cycle(data):
     status_placeholder = st.empty()
     
     if not is_market_open():
         status_placeholder.warning("Market is Closed (09:15 - 15:30 IST). Bot is sleeping.")
         return
 
-    status_placeholder.info("Fetching market data...")
-    data = get_live_data(WATCHLIST)
-    
+    if data is None or data.empty:
+        status_placeholder.error("No market data available. Retrying next cycle.")
+        return
+
     # 1. Check existing positions (Sell Logic)
     portfolio = st.session_state.portfolio
+    tickers, held_qty, buy = portfolio['tickers'], portfolio['qty'], portfolio['buy_price']
+    # Unquoted tickers are priced at cost (0% PnL), so they never trigger a sell
+    prices = current_prices(data, portfolio)
+    pnl_pct = (prices - buy) / buy
+
+    # Sell Check: Target Met or Stop Loss Hit
+    sell_mask = (pnl_pct >= TARGET_PROFIT) | (pnl_pct <= -STOP_LOSS)
     to_sell = []
-    
-    for ticker, pos in portfolio.items():
-        try:
-            current_price = data[ticker]['Close'].iloc[-1]
-            buy_price = pos['buy_price']
-            qty = pos['qty']
-            pnl_pct = (current_price - buy_price) / buy_price
-            
-            # Sell Check: Target Met or Stop Loss Hit
-            if pnl_pct >= TARGET_PROFIT or pnl_pct <= -STOP_LOSS:
-                sell_val = qty * current_price
-                st.session_state.balance += sell_val
-                st.session_state.trade_log.append({
-                    "Action": "SELL",
-                    "Ticker": ticker,
-                    "Price": round(current_price, 2),
-                    "Qty": qty,
-                    "PnL": round(sell_val - (qty * buy_price), 2),
-                    "Time": datetime.now(TIMEZONE).strftime("%H:%M:%S")
-                })
-                to_sell.append(ticker)
-        except Exception as e:
-            continue
-            
-    for ticker in to_sell:
-        del st.session_state.portfolio[ticker]
+
+    for i in np.flatnonzero(sell_mask):
+        sell_val = held_qty[i] * prices[i]
+        st.session_state.balance += sell_val
+        log_trade("SELL", tickers[i], prices[i], held_qty[i], round(sell_val - (held_qty[i] * buy[i]), 2))
+        to_sell.append(tickers[i])
+
+    keep = ~sell_mask
+    portfolio['tickers'] = [t for t, k in zip(tickers, keep) if k]
+    portfolio['qty'] = held_qty[keep]
+    portfolio['buy_price'] = buy[keep]
+    st.session_state.holdings_df.drop(index=to_sell, inplace=True)
 
     # 2. Check for new opportunities (Buy Logic)
     # Only buy if we have cash and existing positions are < max exposure
@@ -132,7 +180,7 @@ def execute_trade_cycle():
         price = opp['price']
         
         # Don't buy if already owned
-        if ticker in st.session_state.portfolio:
+        if ticker in portfolio['tickers']:
             continue
             
         # Position Sizing: Max 20% of CURRENT capital per trade
@@ -144,15 +192,11 @@ def execute_trade_cycle():
             
             # Execute Buy
             st.session_state.balance -= cost
-            st.session_state.portfolio[ticker] = {'qty': qty, 'buy_price': price}
-            st.session_state.trade_log.append({
-                "Action": "BUY",
-                "Ticker": ticker,
-                "Price": round(price, 2),
-                "Qty": qty,
-                "PnL": 0,
-                "Time": datetime.now(TIMEZONE).strftime("%H:%M:%S")
-            })
+            portfolio['tickers'].append(ticker)
+            portfolio['qty'] = np.append(portfolio['qty'], qty)
+            portfolio['buy_price'] = np.append(portfolio['buy_price'], price)
+            st.session_state.holdings_df.loc[ticker] = [ticker, qty, price]
+            log_trade("BUY", ticker, price, qty, 0)
 
     status_placeholder.success(f"Cycle completed at {datetime.now(TIMEZONE).strftime('%H:%M:%S')}")
 
@@ -170,52 +214,46 @@ with st.sidebar:
     st.metric("Bot Status", "Running" if st.session_state.bot_active else "Stopped")
     st.warning("⚠️ Data delayed by ~15 mins (Yahoo Finance)")
 
-# Dashboard Stats
-col1, col2, col3 = st.columns(3)
-current_value = st.session_state.balance
-# Add unrealized PnL from held stocks roughly
-portfolio_val = 0
-for t, p in st.session_state.portfolio.items():
-    portfolio_val += p['qty'] * p['buy_price'] # Using buy price for speed approximation
+# Only this fragment reruns on the bot's tick; Streamlit schedules it, so no
+# sleep holds the script thread between cycles and the Nifty chart is left alone
+@st.fragment(run_every=TICK_SECONDS if st.session_state.bot_active else None)
+def live_dashboard():
+    data = get_live_data(WATCHLIST + [NIFTY_TICKER])
+    if st.session_state.bot_active:
+        execute_trade_cycle(data)
 
-total_equity = current_value + portfolio_val
+    # Dashboard Stats
+    col1, col2, col3 = st.columns(3)
+    # Mark held stocks to market in a single dot product
+    portfolio = st.session_state.portfolio
+    total_equity = st.session_state.balance + float(np.dot(portfolio['qty'], current_prices(data, portfolio)))
 
-col1.metric("Total Portfolio Value", f"₹{total_equity:,.2f}")
-col2.metric("Cash Balance", f"₹{st.session_state.balance:,.2f}")
-col3.metric("Open Positions", len(st.session_state.portfolio))
+    col1.metric("Total Portfolio Value", f"₹{total_equity:,.2f}")
+    col2.metric("Cash Balance", f"₹{st.session_state.balance:,.2f}")
+    col3.metric("Open Positions", len(portfolio['tickers']))
 
-# Main Charts & Tables
-c1, c2 = st.columns([2, 1])
-
-with c1:
     st.subheader("Live Portfolio Performance")
-    if st.session_state.portfolio:
-        # Create a DataFrame for active holdings
-        holdings_data = []
-        for t, p in st.session_state.portfolio.items():
-            holdings_data.append({"Ticker": t, "Qty": p['qty'], "Buy Price": p['buy_price']})
-        st.dataframe(pd.DataFrame(holdings_data), use_container_width=True)
+    if portfolio['tickers']:
+        st.dataframe(st.session_state.holdings_df, hide_index=True, use_container_width=True)
     else:
         st.info("No open positions. Waiting for signals...")
 
     st.subheader("Trade Log")
-    if st.session_state.trade_log:
-        df_log = pd.DataFrame(st.session_state.trade_log)
-        st.dataframe(df_log.iloc[::-1], use_container_width=True) # Show newest first
+    if not st.session_state.trade_log_df.empty:
+        st.dataframe(st.session_state.trade_log_df[::-1], use_container_width=True) # Show newest first
+
+# Main Charts & Tables
+c1, c2 = st.columns([2, 1])
+
+with c1:
+    live_dashboard()
 
 with c2:
     st.subheader("Market Trend (Nifty)")
-    # Simple chart of Nifty 50
-    nifty = yf.download("^NSEI", period="1d", interval="5m", progress=False)
+    # Simple chart of Nifty 50 (shares the cached download with the bot)
+    market_data = get_live_data(WATCHLIST + [NIFTY_TICKER])
+    nifty = pd.DataFrame()
+    if market_data is not None and NIFTY_TICKER in market_data.columns.get_level_values(0):
+        nifty = market_data[NIFTY_TICKER].dropna()
     if not nifty.empty:
-        fig = go.Figure(data=[go.Candlestick(x=nifty.index,
-                        open=nifty['Open'], high=nifty['High'],
-                        low=nifty['Low'], close=nifty['Close'])])
-        fig.update_layout(height=300, margin=dict(l=0, r=0, t=0, b=0))
-        st.plotly_chart(fig, use_container_width=True)
-
-# Auto-Run Logic (Simulation Loop)
-if st.session_state.bot_active:
-    execute_trade_cycle()
-    t_lib.sleep(5) # Wait 5 seconds before rerun
-    st.rerun()
+        st.plotly_chart(nifty_fig((nifty.index[-1], *nifty.iloc[-1][['Open', 'High', 'Low', 'Close']]), nifty), use_container_width=True)